@@ -1,9 +1,12 @@
+import heapq
+import itertools
 import json
 import os
+import tracemalloc
 import requests
 import urllib.parse
 from discord_webhook import DiscordWebhook, DiscordEmbed
-from typing import List, Dict, Any, Optional, Tuple, Union
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterable, Iterator
 
 # --- Constants ---
 WISE_OLD_MAN_API_BASE_URL = "https://api.wiseoldman.net/v2/players/"
@@ -13,6 +16,16 @@ DEFAULT_SEND_RANKING_EMBED = "true"
 DEFAULT_SEND_PLAYER_EMBED = "true"
 REQUEST_TIMEOUT_SECONDS = 10
 DEFAULT_SEND_UPDATE_REQUEST = "true"
+DEFAULT_SEND_LEADERBOARD_EMBED = "false"
+DEFAULT_LEADERBOARD_TOP_K = 3
+MAX_EMBED_FIELDS = 25
+MAX_EMBED_CHARACTERS = 6000
+MAX_LEADERBOARD_TOP_K = 10
+DEFAULT_RANKING_TOP_N = MAX_EMBED_FIELDS
+LEADERBOARD_CATEGORIES = {
+    'experience_gains': {'item_key': 'skill', 'unit': 'xp', 'label': 'Skill'},
+    'boss_gains': {'item_key': 'boss', 'unit': 'kills', 'label': 'Boss'}
+}
 
 # --- Helper Functions ---
 
@@ -126,33 +139,31 @@ def merge_player_data(username: str, response: Dict[str, Any]) -> Dict[str, Any]
         'efficiency_data': get_efficiency_data(response)
     }
 
-def sort_players_by(players: Dict[str, Any], sort_by: str = DEFAULT_SORT_BY) -> Dict[str, Any]:
-    if not players or len(players) == 1:
-        return players
-
-    def get_sort_key(item: Tuple[str, Dict[str, Any]]) -> Union[int, float]:
-        data = item[1]
-        if sort_by in ['experience_gains', 'boss_gains', 'activity_gains']:
-            return sum(detail.get('gained', 0) for detail in data.get(sort_by, []) if isinstance(detail, dict))
-        elif sort_by == 'efficiency_data':
-            eff = data.get('efficiency_data', [{}])
-            return eff[0].get('gained', 0) if eff and isinstance(eff[0], dict) else 0
-        elif sort_by == 'ehp':
-            eff = data.get('efficiency_data', [{}])
-            return eff[0].get('ehp', 0) if eff and isinstance(eff[0], dict) else 0
-        elif sort_by == 'ehb':
-            eff = data.get('efficiency_data', [{}])
-            return eff[0].get('ehb', 0) if eff and isinstance(eff[0], dict) else 0
-        else:
-            return sum(detail.get('gained', 0) for detail in data.get(DEFAULT_SORT_BY, []) if isinstance(detail, dict))
+def get_player_sort_value(data: Dict[str, Any], sort_by: str = DEFAULT_SORT_BY) -> Union[int, float]:
+    if sort_by in ['experience_gains', 'boss_gains', 'activity_gains']:
+        return sum(detail.get('gained', 0) for detail in data.get(sort_by, []) if isinstance(detail, dict))
+    elif sort_by == 'efficiency_data':
+        eff = data.get('efficiency_data', [{}])
+        return eff[0].get('gained', 0) if eff and isinstance(eff[0], dict) else 0
+    elif sort_by == 'ehp':
+        eff = data.get('efficiency_data', [{}])
+        return eff[0].get('ehp', 0) if eff and isinstance(eff[0], dict) else 0
+    elif sort_by == 'ehb':
+        eff = data.get('efficiency_data', [{}])
+        return eff[0].get('ehb', 0) if eff and isinstance(eff[0], dict) else 0
+    else:
+        return sum(detail.get('gained', 0) for detail in data.get(DEFAULT_SORT_BY, []) if isinstance(detail, dict))
 
-    try:
-        return dict(sorted(players.items(), key=get_sort_key, reverse=True))
-    except Exception as e:
-        print(f"Warning: Error during sorting by '{sort_by}': {e}")
-        return players
+def compact_player_data(data: Dict[str, Any]) -> Dict[str, Union[int, float]]:
+    # The ranking only needs these totals, so ranked players don't hold their full gains.
+    eff = data.get('efficiency_data', [{}])[0] if data.get('efficiency_data') else {}
+    return {
+        'total_exp': sum(s.get('gained', 0) for s in data.get('experience_gains', []) if isinstance(s, dict)),
+        'ehp': eff.get('ehp', 0),
+        'ehb': eff.get('ehb', 0)
+    }
 
-def build_ranking_embed(players: Dict[str, Any], period: str = DEFAULT_PERIOD, sort_by: str = DEFAULT_SORT_BY) -> Optional[DiscordEmbed]:
+def build_ranking_embed(players: Dict[str, Dict[str, Union[int, float]]], period: str = DEFAULT_PERIOD, sort_by: str = DEFAULT_SORT_BY) -> Optional[DiscordEmbed]:
     if not players:
         return None
 
@@ -202,11 +213,10 @@ def build_ranking_embed(players: Dict[str, Any], period: str = DEFAULT_PERIOD, s
     }
     config = sort_configs.get(sort_by, sort_configs['experience_gains'])
 
-    for idx, (username, data) in enumerate(players.items(), 1):
-        total_exp = sum(s.get('gained', 0) for s in data.get('experience_gains', []) if isinstance(s, dict))
-        eff = data.get('efficiency_data', [{}])[0] if data.get('efficiency_data') else {}
-        ehp = eff.get('ehp', 0)
-        ehb = eff.get('ehb', 0)
+    for idx, (username, totals) in enumerate(players.items(), 1):
+        total_exp = totals.get('total_exp', 0)
+        ehp = totals.get('ehp', 0)
+        ehb = totals.get('ehb', 0)
         primary_metric_val = config['get_val'](total_exp, ehp, ehb)
         primary_metric_label = config['label']
 
@@ -262,11 +272,213 @@ def build_player_embeds(players: Dict[str, Any], period: str = DEFAULT_PERIOD) -
             player_embed_list.append(embed)
     return player_embed_list
 
-def execute_discord_webhooks(embeds_to_send: List[DiscordEmbed], webhook_url: str) -> None:
-    current_embed_description = "N/A"
+def _push_bounded(heap: List[Tuple[Any, ...]], item: Tuple[Any, ...], limit: int) -> None:
+    if len(heap) < limit:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+def new_leaderboard_state(top_k: int = DEFAULT_LEADERBOARD_TOP_K) -> Dict[str, Any]:
+    return {
+        'top_k': top_k,
+        'heaps': {category: {} for category in LEADERBOARD_CATEGORIES},
+        'totals': {category: {} for category in LEADERBOARD_CATEGORIES}
+    }
+
+def add_player_to_leaderboards(state: Dict[str, Any], order: int, username: str, data: Dict[str, Any]) -> None:
+    # Each metric keeps a running group total and a bounded min-heap of its top_k gainers,
+    # so a full pass costs O(entries * log top_k).
+    top_k = state['top_k']
+    if top_k <= 0:
+        return
+    for category, config in LEADERBOARD_CATEGORIES.items():
+        category_heaps = state['heaps'][category]
+        category_totals = state['totals'][category]
+        for entry in data.get(category, []):
+            if not isinstance(entry, dict):
+                continue
+            gained = entry.get('gained', 0)
+            if not isinstance(gained, (int, float)) or gained <= 0:
+                continue
+            metric = entry.get(config['item_key'], 'Unknown')
+            category_totals[metric] = category_totals.get(metric, 0) + gained
+            # Negated order keeps the earliest player on ties, matching the ranking order.
+            _push_bounded(category_heaps.setdefault(metric, []), (gained, -order, username), top_k)
+
+def finalize_leaderboards(state: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    return {
+        category: {
+            metric: {
+                'total': state['totals'][category][metric],
+                'top': [(username, gained) for gained, _, username in sorted(heap, reverse=True)]
+            }
+            for metric, heap in state['heaps'][category].items()
+        }
+        for category in LEADERBOARD_CATEGORIES
+    }
+
+def _paginate_fields(fields: List[Tuple[str, str]], reserved_characters: int) -> List[List[Tuple[str, str]]]:
+    # Discord rejects embeds over 25 fields or 6000 characters in total, so fields are packed
+    # greedily into pages that respect both limits.
+    pages: List[List[Tuple[str, str]]] = []
+    page: List[Tuple[str, str]] = []
+    page_characters = reserved_characters
+    for name, value in fields:
+        field_characters = len(name) + len(value)
+        if page and (len(page) >= MAX_EMBED_FIELDS or page_characters + field_characters > MAX_EMBED_CHARACTERS):
+            pages.append(page)
+            page = []
+            page_characters = reserved_characters
+        page.append((name, value))
+        page_characters += field_characters
+    if page:
+        pages.append(page)
+    return pages
+
+def build_leaderboard_embeds(leaderboards: Dict[str, Dict[str, Dict[str, Any]]], period: str = DEFAULT_PERIOD) -> List[DiscordEmbed]:
+    leaderboard_embed_list = []
+    period_title = format_period_for_title(period)
+    author = "Osrs Activity Bot"
+    for category, config in LEADERBOARD_CATEGORIES.items():
+        metrics = leaderboards.get(category, {})
+        if not metrics:
+            continue
+        ordered_metrics = sorted(metrics.items(), key=lambda item: item[1]['total'], reverse=True)
+        group_total = sum(board['total'] for _, board in ordered_metrics)
+        fields = []
+        for metric, board in ordered_metrics:
+            value_lines = [f"#{idx} {username}: `{gained:,}` {config['unit']}" for idx, (username, gained) in enumerate(board['top'], 1)]
+            value_lines.append(f"Group: `{board['total']:,}` {config['unit']}")
+            fields.append((metric.replace('_', ' ').capitalize(), "\n".join(value_lines)))
+
+        base_title = f"{period_title} Top Gainers by {config['label']}"
+        description = f"Group total: `{group_total:,}` {config['unit']}"
+        footer = f"{config['label']} Leaderboards - Generated by Osrs Activity Bot"
+        # Leave room for a " (99/99)" page suffix on the title.
+        reserved_characters = len(base_title) + len(" (99/99)") + len(description) + len(footer) + len(author)
+        pages = _paginate_fields(fields, reserved_characters)
+        for page_number, page in enumerate(pages, 1):
+            title = base_title
+            if len(pages) > 1:
+                title += f" ({page_number}/{len(pages)})"
+            embed = DiscordEmbed(title=title, description=description, color="03b2f8")
+            embed.set_author(name=author)
+            embed.set_footer(text=footer)
+            embed.set_timestamp()
+            for name, value in page:
+                embed.add_embed_field(name=name, value=value, inline=False)
+            leaderboard_embed_list.append(embed)
+    return leaderboard_embed_list
+
+# --- Streaming Pipeline ---
+
+def iter_active_player_responses(
+    usernames: Iterable[str],
+    period: str = DEFAULT_PERIOD,
+    send_update_request: bool = True,
+    fetch_errors: Optional[Dict[str, str]] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    for username in usernames:
+        if send_update_request:
+            send_player_update(username)
+
+        response = get_player_data(username, period)
+        if response.get('error'):
+            print(f"Error fetching data for {username}: {response['error']}")
+            if fetch_errors is not None:
+                fetch_errors[username] = response['error']
+            continue
+
+        overall_xp_gained = get_overall_experience_gained(response)
+        if overall_xp_gained <= 0:
+            print(f"Skipping {username}: 0 overall XP gained for {period}.")
+            continue
+
+        yield username, response
+
+def iter_merged_players(responses: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    for username, response in responses:
+        yield username, merge_player_data(username, response)
+
+def new_report_state(sort_by: str = DEFAULT_SORT_BY, ranking_top_n: int = DEFAULT_RANKING_TOP_N, leaderboard_top_k: int = DEFAULT_LEADERBOARD_TOP_K) -> Dict[str, Any]:
+    return {
+        'sort_by': sort_by,
+        'ranking_top_n': ranking_top_n,
+        'player_count': 0,
+        'ranking_heap': [],
+        'leaderboards': new_leaderboard_state(leaderboard_top_k)
+    }
+
+def add_player_to_report(state: Dict[str, Any], username: str, data: Dict[str, Any]) -> None:
+    order = state['player_count']
+    state['player_count'] += 1
+    if state['ranking_top_n'] > 0:
+        sort_value = get_player_sort_value(data, state['sort_by'])
+        # Order is unique per player, so heap comparisons never reach the username or data.
+        _push_bounded(state['ranking_heap'], (sort_value, -order, username, compact_player_data(data)), state['ranking_top_n'])
+    add_player_to_leaderboards(state['leaderboards'], order, username, data)
+
+def get_ranked_players(state: Dict[str, Any], limit: Optional[int] = None) -> Dict[str, Any]:
+    heap = state['ranking_heap']
+    ranked = sorted(heap, reverse=True) if limit is None else heapq.nlargest(limit, heap)
+    return {username: data for _, _, username, data in ranked}
+
+def stream_player_embeds(merged_players: Iterable[Tuple[str, Dict[str, Any]]], state: Dict[str, Any], period: str = DEFAULT_PERIOD, send_player_embed: bool = True) -> Iterator[DiscordEmbed]:
+    for username, data in merged_players:
+        add_player_to_report(state, username, data)
+        if send_player_embed:
+            yield from build_player_embeds({username: data}, period)
+
+def stream_summary_embeds(state: Dict[str, Any], period: str = DEFAULT_PERIOD, send_ranking_embed: bool = True, send_leaderboard_embed: bool = False) -> Iterator[DiscordEmbed]:
+    if send_ranking_embed:
+        ranking_embed = build_ranking_embed(get_ranked_players(state), period, state['sort_by'])
+        if ranking_embed:
+            yield ranking_embed
+    if send_leaderboard_embed:
+        yield from build_leaderboard_embeds(finalize_leaderboards(state['leaderboards']), period)
+
+def start_memory_tracking() -> bool:
+    # tracemalloc is reset per invocation, unlike ru_maxrss which keeps the peak of the whole
+    # (possibly warm) Lambda container. Its overhead is small next to the per-player HTTP calls.
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return started
+
+def stop_memory_tracking(started: bool) -> float:
+    peak = tracemalloc.get_traced_memory()[1]
+    if started:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 1)
+
+def get_int_env(name: str, default: int) -> int:
     try:
-        for i, embed_content in enumerate(embeds_to_send):
-            current_embed_description = embed_content.title if embed_content and hasattr(embed_content, 'title') else f"Embed #{i+1}"
+        return int(os.environ.get(name, default))
+    except ValueError:
+        print(f"Warning: Invalid {name}, defaulting to {default}.")
+        return default
+
+def get_leaderboard_top_k() -> int:
+    top_k = get_int_env('LEADERBOARD_TOP_K', DEFAULT_LEADERBOARD_TOP_K)
+    if top_k > MAX_LEADERBOARD_TOP_K:
+        print(f"Warning: LEADERBOARD_TOP_K capped at {MAX_LEADERBOARD_TOP_K}.")
+        return MAX_LEADERBOARD_TOP_K
+    return top_k
+
+def get_ranking_top_n() -> int:
+    top_n = get_int_env('RANKING_TOP_N', DEFAULT_RANKING_TOP_N)
+    if top_n > MAX_EMBED_FIELDS:
+        print(f"Warning: RANKING_TOP_N capped at {MAX_EMBED_FIELDS}.")
+        return MAX_EMBED_FIELDS
+    return top_n
+
+def execute_discord_webhooks(embeds_to_send: Iterable[DiscordEmbed], webhook_url: str) -> None:
+    # Errors are handled per embed so that exceptions raised while producing the next embed
+    # (e.g. from a streaming pipeline) propagate instead of being reported as delivery failures.
+    for i, embed_content in enumerate(embeds_to_send):
+        current_embed_description = embed_content.title if embed_content and hasattr(embed_content, 'title') else f"Embed #{i+1}"
+        try:
             webhook = DiscordWebhook(url=webhook_url, username="Osrs Activity Bot")
             webhook.add_embed(embed_content)
             responses = webhook.execute()
@@ -276,12 +488,12 @@ def execute_discord_webhooks(embeds_to_send: List[DiscordEmbed], webhook_url: st
                     if hasattr(response, 'status_code') and response.status_code >= 400:
                         error_content = response.content.decode() if hasattr(response, 'content') else 'No content'
                         print(f"Discord webhook for embed '{current_embed_description}' returned error status {response.status_code}: {error_content}")
-    except requests.exceptions.RequestException as e:
-        print(f"Network error sending Discord embed '{current_embed_description}': {e}")
-    except ValueError as e:
-        print(f"Configuration error for Discord webhook (possibly for embed '{current_embed_description}'): {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred sending Discord embed '{current_embed_description}': {e}")
+        except requests.exceptions.RequestException as e:
+            print(f"Network error sending Discord embed '{current_embed_description}': {e}")
+        except ValueError as e:
+            print(f"Configuration error for Discord webhook (possibly for embed '{current_embed_description}'): {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred sending Discord embed '{current_embed_description}': {e}")
 
 def lambda_handler(event, context):
     usernames_to_fetch = [name.strip() for name in os.environ.get('USERNAMES', '').split(',') if name.strip()]
@@ -291,51 +503,46 @@ def lambda_handler(event, context):
     period = os.environ.get('PERIOD', DEFAULT_PERIOD)
     sort_by = os.environ.get('SORT_BY', DEFAULT_SORT_BY)
     send_player_update_request = os.environ.get("SEND_PLAYER_UPDATE", DEFAULT_SEND_UPDATE_REQUEST).lower() == 'true'
+    send_leaderboard_embed = os.environ.get('SEND_LEADERBOARD_EMBED', DEFAULT_SEND_LEADERBOARD_EMBED).lower() == 'true'
+    leaderboard_top_k = get_leaderboard_top_k()
+    ranking_top_n = get_ranking_top_n()
 
     if not usernames_to_fetch or not webhook_url:
         print("USERNAMES and WEBHOOK_URL environment variables are required.")
         return {'statusCode': 400, 'body': json.dumps({'message': 'Missing configuration.'})}
 
-    players = {}
-    for username in usernames_to_fetch:
-        if send_player_update_request:
-            send_player_update(username)
-
-        response = get_player_data(username, period)
-        if response.get('error'):
-            print(f"Error fetching data for {username}: {response['error']}")
-            continue
-
-        overall_xp_gained = get_overall_experience_gained(response)
-        if overall_xp_gained <= 0:
-            print(f"Skipping {username}: 0 overall XP gained for {period}.")
-            continue
-
-        players[username] = merge_player_data(username, response)
-
-    if players:
-        sorted_players = sort_players_by(players, sort_by)
-        all_embeds_to_send = []
-
-        ranking_embed = build_ranking_embed(sorted_players, period, sort_by)
-        if ranking_embed and send_ranking_embed:
-            all_embeds_to_send.append(ranking_embed)
-
-        if send_player_embed:
-            player_embeds = build_player_embeds(sorted_players, period)
-            all_embeds_to_send.extend(player_embeds)
-
-        if all_embeds_to_send:
-            execute_discord_webhooks(all_embeds_to_send, webhook_url)
-
-        print(f"Data processed for {len(sorted_players)} active players.")
+    # Players stream through fetch -> merge -> embed one at a time; only the bounded ranking
+    # heap and per-metric leaderboard totals outlive each player.
+    memory_tracking_started = start_memory_tracking()
+    try:
+        state = new_report_state(sort_by, ranking_top_n, leaderboard_top_k)
+        merged_players = iter_merged_players(iter_active_player_responses(usernames_to_fetch, period, send_player_update_request))
+        embed_stream = itertools.chain(
+            stream_player_embeds(merged_players, state, period, send_player_embed),
+            stream_summary_embeds(state, period, send_ranking_embed, send_leaderboard_embed)
+        )
+
+        first_embed = next(embed_stream, None)
+        if first_embed is not None:
+            execute_discord_webhooks(itertools.chain([first_embed], embed_stream), webhook_url)
+        # Drain anything the sender did not consume so every player is still processed and counted.
+        for _ in embed_stream:
+            pass
+    finally:
+        peak_memory_mb = stop_memory_tracking(memory_tracking_started)
+
+    if state['player_count']:
+        print(f"Data processed for {state['player_count']} active players.")
     else:
         print("No active players found or data fetched.")
 
+    print(f"Peak Python memory usage for this invocation: {peak_memory_mb} MB")
+
     return {
         'statusCode': 200,
         'body': json.dumps({
-            'message': f"Data processed for {len(players)} players.",
+            'message': f"Data processed for {state['player_count']} players.",
+            'peak_memory_mb': peak_memory_mb
         })
     }
 
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+from lambda_function import (
+    DEFAULT_PERIOD, DEFAULT_SORT_BY, DEFAULT_SEND_UPDATE_REQUEST,
+    DEFAULT_SEND_RANKING_EMBED, DEFAULT_SEND_LEADERBOARD_EMBED,
+    new_report_state, add_player_to_report, get_ranked_players, build_ranking_embed, build_leaderboard_embeds,
+    iter_merged_players, iter_active_player_responses, finalize_leaderboards,
+    execute_discord_webhooks, get_int_env, get_leaderboard_top_k, get_ranking_top_n
+)
+
+# --- Constants ---
+DEFAULT_SERVICE_HOST = "127.0.0.1"
+DEFAULT_SERVICE_PORT = 8080
+DEFAULT_REFRESH_INTERVAL_SECONDS = 900
+DEFAULT_SEND_DISCORD_ON_REFRESH = "false"
+MAX_REQUEST_HEADER_LINES = 100
+REQUEST_READ_TIMEOUT_SECONDS = 5
+MAX_FETCH_FAILURE_RATIO = 0.5
+HTTP_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 408: "Request Timeout", 503: "Service Unavailable"}
+
+# --- Configuration ---
+
+def load_service_config() -> Dict[str, Any]:
+    usernames = [name.strip() for name in os.environ.get('USERNAMES', '').split(',') if name.strip()]
+    return {
+        'usernames': usernames,
+        'webhook_url': os.environ.get('WEBHOOK_URL'),
+        'period': os.environ.get('PERIOD', DEFAULT_PERIOD),
+        'sort_by': os.environ.get('SORT_BY', DEFAULT_SORT_BY),
+        'send_player_update': os.environ.get('SEND_PLAYER_UPDATE', DEFAULT_SEND_UPDATE_REQUEST).lower() == 'true',
+        'send_discord_on_refresh': os.environ.get('SEND_DISCORD_ON_REFRESH', DEFAULT_SEND_DISCORD_ON_REFRESH).lower() == 'true',
+        'send_ranking_embed': os.environ.get('SEND_RANKING_EMBED', DEFAULT_SEND_RANKING_EMBED).lower() == 'true',
+        'send_leaderboard_embed': os.environ.get('SEND_LEADERBOARD_EMBED', DEFAULT_SEND_LEADERBOARD_EMBED).lower() == 'true',
+        'leaderboard_top_k': get_leaderboard_top_k(),
+        'ranking_top_n': get_ranking_top_n(),
+        'refresh_interval_seconds': get_int_env('REFRESH_INTERVAL_SECONDS', DEFAULT_REFRESH_INTERVAL_SECONDS),
+        'host': os.environ.get('SERVICE_HOST', DEFAULT_SERVICE_HOST),
+        'port': get_int_env('SERVICE_PORT', DEFAULT_SERVICE_PORT)
+    }
+
+# --- Snapshot Building ---
+
+def build_snapshot(config: Dict[str, Any]) -> Dict[str, Any]:
+    # Runs the same fetch -> merge pipeline as lambda_handler and keeps the whole roster in the
+    # ranking so the API can serve every player.
+    state = new_report_state(config['sort_by'], len(config['usernames']), config['leaderboard_top_k'])
+    fetch_errors: Dict[str, str] = {}
+    merged_players = iter_merged_players(iter_active_player_responses(config['usernames'], config['period'], config['send_player_update'], fetch_errors))
+    for username, data in merged_players:
+        add_player_to_report(state, username, data)
+
+    # During a Wise Old Man outage most fetches fail; publishing that would replace good cached
+    # rankings with an empty or partial snapshot.
+    if config['usernames'] and len(fetch_errors) > len(config['usernames']) * MAX_FETCH_FAILURE_RATIO:
+        raise RuntimeError(f"{len(fetch_errors)} of {len(config['usernames'])} player fetches failed; keeping previous rankings.")
+
+    rankings = []
+    for rank, (sort_value, _, username, totals) in enumerate(sorted(state['ranking_heap'], reverse=True), 1):
+        rankings.append({
+            'rank': rank,
+            'username': username,
+            'value': sort_value,
+            'experience': totals['total_exp'],
+            'ehp': totals['ehp'],
+            'ehb': totals['ehb']
+        })
+
+    leaderboards = {
+        category: {
+            metric: {'total': board['total'], 'top': [{'username': username, 'gained': gained} for username, gained in board['top']]}
+            for metric, board in metrics.items()
+        }
+        for category, metrics in finalize_leaderboards(state['leaderboards']).items()
+    }
+
+    return {
+        'period': config['period'],
+        'sort_by': config['sort_by'],
+        'refreshed_at': datetime.now(timezone.utc).isoformat(),
+        'player_count': state['player_count'],
+        'failed_fetch_count': len(fetch_errors),
+        'rankings': rankings,
+        'leaderboards': leaderboards,
+        'state': state
+    }
+
+def _encode_json(payload: Any) -> bytes:
+    return json.dumps(payload).encode()
+
+def new_service_state() -> Dict[str, Any]:
+    return {'snapshot': None, 'responses': {}, 'last_error': None}
+
+def publish_snapshot(service_state: Dict[str, Any], snapshot: Dict[str, Any]) -> None:
+    # Bodies are serialised once per refresh so reads never touch the pipeline state.
+    summary = {key: snapshot[key] for key in ('period', 'sort_by', 'refreshed_at', 'player_count')}
+    service_state['snapshot'] = snapshot
+    service_state['last_error'] = None
+    service_state['responses'] = {
+        '/rankings': _encode_json({**summary, 'rankings': snapshot['rankings']}),
+        '/leaderboards': _encode_json({**summary, 'leaderboards': snapshot['leaderboards']})
+    }
+
+# --- Background Refresh ---
+
+def post_snapshot_to_discord(snapshot: Dict[str, Any], config: Dict[str, Any]) -> None:
+    # The snapshot ranks the whole roster; Discord only gets the top RANKING_TOP_N so the
+    # ranking embed stays within the field limit, as in lambda_handler.
+    state = snapshot['state']
+    embeds = []
+    if config['send_ranking_embed']:
+        ranking_embed = build_ranking_embed(get_ranked_players(state, config['ranking_top_n']), config['period'], config['sort_by'])
+        if ranking_embed:
+            embeds.append(ranking_embed)
+    if config['send_leaderboard_embed']:
+        embeds.extend(build_leaderboard_embeds(finalize_leaderboards(state['leaderboards']), config['period']))
+    if embeds:
+        execute_discord_webhooks(embeds, config['webhook_url'])
+
+async def refresh_once(service_state: Dict[str, Any], config: Dict[str, Any]) -> None:
+    try:
+        snapshot = await asyncio.to_thread(build_snapshot, config)
+    except Exception as e:
+        service_state['last_error'] = str(e)
+        print(f"Error refreshing player gains: {e}")
+        return
+
+    publish_snapshot(service_state, snapshot)
+    print(f"Refreshed gains for {snapshot['player_count']} active players.")
+
+    if config['send_discord_on_refresh'] and config['webhook_url']:
+        await asyncio.to_thread(post_snapshot_to_discord, snapshot, config)
+
+async def refresh_forever(service_state: Dict[str, Any], config: Dict[str, Any]) -> None:
+    while True:
+        await refresh_once(service_state, config)
+        await asyncio.sleep(max(config['refresh_interval_seconds'], 1))
+
+# --- HTTP API ---
+
+def route_request(service_state: Dict[str, Any], method: str, path: str) -> Tuple[int, bytes]:
+    path = path.split('?', 1)[0].rstrip('/') or '/'
+    if method != 'GET':
+        return 405, _encode_json({'message': 'Only GET is supported.'})
+    if path == '/health':
+        snapshot = service_state['snapshot']
+        return 200, _encode_json({
+            'status': 'degraded' if service_state['last_error'] else 'ok',
+            'refreshed_at': snapshot['refreshed_at'] if snapshot else None,
+            'failed_fetch_count': snapshot['failed_fetch_count'] if snapshot else None,
+            'last_error': service_state['last_error']
+        })
+    if path in service_state['responses']:
+        return 200, service_state['responses'][path]
+    if path in ('/rankings', '/leaderboards'):
+        return 503, _encode_json({'message': 'Rankings not available yet.'})
+    return 404, _encode_json({'message': 'Not found.'})
+
+async def _read_request_line(reader: asyncio.StreamReader) -> List[str]:
+    request_line = (await reader.readline()).decode('latin-1').split()
+    for _ in range(MAX_REQUEST_HEADER_LINES):
+        if (await reader.readline()) in (b'\r\n', b'\n', b''):
+            break
+    return request_line
+
+async def handle_http_connection(service_state: Dict[str, Any], reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        try:
+            request_line = await asyncio.wait_for(_read_request_line(reader), REQUEST_READ_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            status, body = 408, _encode_json({'message': 'Timed out reading request.'})
+        except (ValueError, asyncio.LimitOverrunError):
+            # StreamReader.readline raises ValueError for lines over its 64 KiB buffer limit.
+            status, body = 400, _encode_json({'message': 'Request too large.'})
+        else:
+            if len(request_line) < 2:
+                status, body = 400, _encode_json({'message': 'Malformed request.'})
+            else:
+                status, body = route_request(service_state, request_line[0].upper(), request_line[1])
+
+        headers = [
+            f"HTTP/1.1 {status} {HTTP_STATUS_TEXT.get(status, '')}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: close"
+        ]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        print(f"Connection error while serving request: {e}")
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def start_http_server(service_state: Dict[str, Any], host: str = DEFAULT_SERVICE_HOST, port: int = DEFAULT_SERVICE_PORT) -> asyncio.AbstractServer:
+    return await asyncio.start_server(lambda reader, writer: handle_http_connection(service_state, reader, writer), host, port)
+
+async def run_service(config: Optional[Dict[str, Any]] = None) -> None:
+    config = config or load_service_config()
+    if not config['usernames']:
+        print("USERNAMES environment variable is required.")
+        return
+
+    service_state = new_service_state()
+    server = await start_http_server(service_state, config['host'], config['port'])
+    print(f"Serving rankings on http://{config['host']}:{config['port']} (refresh every {config['refresh_interval_seconds']}s).")
+    async with server:
+        await asyncio.gather(server.serve_forever(), refresh_forever(service_state, config))
+
+if __name__ == "__main__":
+    asyncio.run(run_service())
@@ -2,11 +2,14 @@ import unittest
 import json
 import os
 import requests
+import tracemalloc
 from unittest.mock import patch
 from lambda_function import (
     lambda_handler, send_player_update, get_player_data, is_player_active, filter_experience_gains,
     filter_boss_gains, filter_activity_gains, get_efficiency_data, merge_player_data,
-    sort_players_by, build_ranking_embed, build_player_embeds
+    build_ranking_embed, build_player_embeds, new_report_state, add_player_to_report, get_ranked_players,
+    new_leaderboard_state, add_player_to_leaderboards, finalize_leaderboards,
+    build_leaderboard_embeds, compact_player_data, execute_discord_webhooks, get_leaderboard_top_k, get_ranking_top_n, MAX_LEADERBOARD_TOP_K
 )
 from discord_webhook import DiscordEmbed
 
@@ -14,6 +17,18 @@ def load_fixture(filename):
     with open(f'tests/fixtures/{filename}', 'r') as f:
         return json.load(f)
 
+def rank_players(players, sort_by='experience_gains', ranking_top_n=25):
+    state = new_report_state(sort_by, ranking_top_n)
+    for username, data in players.items():
+        add_player_to_report(state, username, data)
+    return get_ranked_players(state)
+
+def build_leaderboards(players, top_k=3):
+    state = new_leaderboard_state(top_k)
+    for order, (username, data) in enumerate(players.items()):
+        add_player_to_leaderboards(state, order, username, data)
+    return finalize_leaderboards(state)
+
 class TestLambdaHandler(unittest.TestCase):
     @patch.dict(os.environ, {
         'WEBHOOK_URL': 'http://mockwebhookurl.com/test',
@@ -186,6 +201,133 @@ class TestLambdaHandler(unittest.TestCase):
             self.assertEqual([call.args[0] for call in mock_merge_player_data.call_args_list], ['ActiveUser', 'AnotherActiveUser'])
             mock_execute_webhooks.assert_not_called()
 
+    @patch.dict(os.environ, {
+        'WEBHOOK_URL': 'http://mockwebhookurl.com/test',
+        'USERNAMES': 'PlayerOne',
+        'SEND_RANKING_EMBED': 'false',
+        'SEND_PLAYER_EMBED': 'false',
+        'SEND_LEADERBOARD_EMBED': 'true',
+        'SEND_PLAYER_UPDATE': 'false'
+    })
+    @patch('lambda_function.execute_discord_webhooks')
+    def test_lambda_handler_leaderboard_embeds(self, mock_execute_webhooks):
+        mock_player_data = {
+            'data': {
+                'skills': {
+                    'overall': {'metric': 'overall', 'experience': {'gained': 1000}},
+                    'attack': {'metric': 'attack', 'experience': {'gained': 500}},
+                },
+                'bosses': {'zulrah': {'metric': 'zulrah', 'kills': {'gained': 3}}},
+                'activities': {},
+                'computed': {'ehp': {'value': {'gained': 1.0}}, 'ehb': {'value': {'gained': 0.5}}}
+            }
+        }
+        sent_embeds = []
+        mock_execute_webhooks.side_effect = lambda embeds, webhook_url: sent_embeds.extend(embeds)
+        with patch('lambda_function.get_player_data', return_value=mock_player_data):
+            response = lambda_handler({}, None)
+            self.assertEqual(response['statusCode'], 200)
+            self.assertEqual([embed.title for embed in sent_embeds], ["Day Top Gainers by Skill", "Day Top Gainers by Boss"])
+
+    @patch.dict(os.environ, {
+        'WEBHOOK_URL': 'http://mockwebhookurl.com/test',
+        'USERNAMES': 'Slow,Fast,Mid',
+        'SEND_RANKING_EMBED': 'true',
+        'SEND_PLAYER_EMBED': 'true',
+        'SEND_PLAYER_UPDATE': 'false',
+        'RANKING_TOP_N': '2'
+    })
+    @patch('lambda_function.execute_discord_webhooks')
+    def test_lambda_handler_streams_player_embeds_then_bounded_ranking(self, mock_execute_webhooks):
+        def player_data(overall_xp):
+            return {
+                'data': {
+                    'skills': {
+                        'overall': {'metric': 'overall', 'experience': {'gained': overall_xp}},
+                        'attack': {'metric': 'attack', 'experience': {'gained': overall_xp}},
+                    },
+                    'bosses': {}, 'activities': {},
+                    'computed': {'ehp': {'value': {'gained': 1.0}}, 'ehb': {'value': {'gained': 0.5}}}
+                }
+            }
+
+        sent_embeds = []
+        mock_execute_webhooks.side_effect = lambda embeds, webhook_url: sent_embeds.extend(embeds)
+        with patch('lambda_function.get_player_data', side_effect=[player_data(100), player_data(300), player_data(200)]):
+            response = lambda_handler({}, None)
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertIsInstance(json.loads(response['body'])['peak_memory_mb'], float)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual([embed.title for embed in sent_embeds], [
+            "Day Gains for Slow", "Day Gains for Fast", "Day Gains for Mid", "Day Group Ranking by Experience Gains"
+        ])
+        self.assertEqual([field['name'] for field in sent_embeds[-1].fields], ["#1 Fast", "#2 Mid"])
+
+    @patch.dict(os.environ, {
+        'WEBHOOK_URL': 'http://mockwebhookurl.com/test',
+        'USERNAMES': 'PlayerOne,PlayerTwo',
+        'SEND_PLAYER_UPDATE': 'false'
+    })
+    @patch('lambda_function.execute_discord_webhooks', side_effect=lambda embeds, webhook_url: next(iter(embeds)))
+    def test_lambda_handler_counts_players_when_delivery_stops_early(self, mock_execute_webhooks):
+        mock_player_data = {
+            'data': {
+                'skills': {'overall': {'metric': 'overall', 'experience': {'gained': 1000}}},
+                'bosses': {}, 'activities': {},
+                'computed': {'ehp': {'value': {'gained': 1.0}}, 'ehb': {'value': {'gained': 0.5}}}
+            }
+        }
+        with patch('lambda_function.get_player_data', return_value=mock_player_data) as mock_get_player_data:
+            response = lambda_handler({}, None)
+            self.assertEqual(mock_get_player_data.call_count, 2)
+            self.assertEqual(json.loads(response['body'])['message'], "Data processed for 2 players.")
+
+    @patch.dict(os.environ, {
+        'WEBHOOK_URL': 'http://mockwebhookurl.com/test',
+        'USERNAMES': 'PlayerA,PlayerB,PlayerC',
+        'SEND_PLAYER_UPDATE': 'false'
+    })
+    @patch('lambda_function.DiscordWebhook')
+    def test_lambda_handler_surfaces_pipeline_errors_mid_roster(self, mock_webhook):
+        mock_player_data = {
+            'data': {
+                'skills': {'overall': {'metric': 'overall', 'experience': {'gained': 1000}}},
+                'bosses': {}, 'activities': {},
+                'computed': {'ehp': {'value': {'gained': 1.0}}, 'ehb': {'value': {'gained': 0.5}}}
+            }
+        }
+        malformed_player_data = [mock_player_data]
+        with patch('lambda_function.get_player_data', side_effect=[mock_player_data, malformed_player_data, mock_player_data]):
+            with self.assertRaises(AttributeError):
+                lambda_handler({}, None)
+        self.assertEqual(mock_webhook.return_value.execute.call_count, 1)
+
+    @patch.dict(os.environ, {
+        'WEBHOOK_URL': 'http://mockwebhookurl.com/test',
+        'USERNAMES': ','.join(f"Player{i:02d}" for i in range(40)),
+        'SEND_RANKING_EMBED': 'true',
+        'SEND_PLAYER_EMBED': 'false',
+        'SEND_PLAYER_UPDATE': 'false',
+        'RANKING_TOP_N': '40'
+    })
+    @patch('lambda_function.execute_discord_webhooks')
+    def test_lambda_handler_caps_ranking_at_embed_field_limit(self, mock_execute_webhooks):
+        mock_player_data = {
+            'data': {
+                'skills': {'overall': {'metric': 'overall', 'experience': {'gained': 1000}}},
+                'bosses': {}, 'activities': {},
+                'computed': {'ehp': {'value': {'gained': 1.0}}, 'ehb': {'value': {'gained': 0.5}}}
+            }
+        }
+        sent_embeds = []
+        mock_execute_webhooks.side_effect = lambda embeds, webhook_url: sent_embeds.extend(embeds)
+        with patch('lambda_function.get_player_data', return_value=mock_player_data):
+            response = lambda_handler({}, None)
+
+        self.assertEqual(json.loads(response['body'])['message'], "Data processed for 40 players.")
+        self.assertEqual([len(embed.fields) for embed in sent_embeds], [25])
+
 class TestIsPlayerActive(unittest.TestCase):
     def setUp(self):
         self.active = load_fixture('active-player-gained-response.json')
@@ -282,7 +424,7 @@ class TestMergePlayerData(unittest.TestCase):
         self.assertIsInstance(player_data['activity_gains'], list)
         self.assertIsInstance(player_data['efficiency_data'], list)
 
-class TestSortPlayersBy(unittest.TestCase):
+class TestRankPlayers(unittest.TestCase):
     def setUp(self):
         self.players = {
             "Alice": {
@@ -299,7 +441,7 @@ class TestSortPlayersBy(unittest.TestCase):
             }
         }
 
-    def test_sort_players(self):
+    def test_rank_players(self):
         cases = [
             ('experience_gains', ["Bob", "Alice"]),
             ('boss_gains', ["Alice", "Bob"]),
@@ -310,8 +452,11 @@ class TestSortPlayersBy(unittest.TestCase):
         ]
         for sort_by, expected in cases:
             with self.subTest(sort_by=sort_by):
-                sorted_players = sort_players_by(self.players, sort_by)
-                self.assertEqual(list(sorted_players.keys()), expected)
+                ranked_players = rank_players(self.players, sort_by)
+                self.assertEqual(list(ranked_players.keys()), expected)
+
+    def test_rank_players_keeps_only_top_n(self):
+        self.assertEqual(rank_players(self.players, 'experience_gains', ranking_top_n=1), {"Bob": {'total_exp': 200, 'ehp': 100, 'ehb': 10}})
 
 class TestBuildRankingEmbed(unittest.TestCase):
     def setUp(self):
@@ -329,7 +474,7 @@ class TestBuildRankingEmbed(unittest.TestCase):
                 "efficiency_data": [{"ehp": 10.0, "ehb": 0.5, "gained": 10.5}]
             }
         }
-        self.sorted_players_exp = sort_players_by(self.players_data, 'experience_gains')
+        self.sorted_players_exp = rank_players(self.players_data, 'experience_gains')
 
     def test_build_ranking_embed_fields_content(self):
         embed = build_ranking_embed(self.sorted_players_exp, sort_by='experience_gains')
@@ -337,6 +482,11 @@ class TestBuildRankingEmbed(unittest.TestCase):
         self.assertEqual(len(embed.fields), 2)
         self.assertEqual(embed.fields[0]['name'], "#1 PlayerA")
         self.assertEqual(embed.fields[1]['name'], "#2 PlayerB")
+        self.assertEqual(embed.fields[0]['value'], "EXP: `8,888,888`\nEHP: `12.3`\nEHB: `1.2`")
+
+    def test_compact_player_data(self):
+        self.assertEqual(compact_player_data(self.players_data["PlayerA"]), {'total_exp': 8888888, 'ehp': 12.3, 'ehb': 1.2})
+        self.assertEqual(compact_player_data({'experience_gains': [], 'efficiency_data': []}), {'total_exp': 0, 'ehp': 0, 'ehb': 0})
 
 class TestBuildPlayerEmbeds(unittest.TestCase):
     def setUp(self):
@@ -358,5 +508,79 @@ class TestBuildPlayerEmbeds(unittest.TestCase):
         self.assertEqual(embed.author['name'], "PlayerC")
         self.assertEqual(embed.author['url'], "https://wiseoldman.net/players/PlayerC/gained?period=day")
 
+class TestLeaderboards(unittest.TestCase):
+    def setUp(self):
+        self.players = {
+            "Alice": {
+                "experience_gains": [{"skill": "attack", "gained": 100}, {"skill": "magic", "gained": 300}],
+                "boss_gains": [{"boss": "zulrah", "gained": 5}],
+                "activity_gains": [],
+                "efficiency_data": [{"ehp": 1.0, "ehb": 0.5, "gained": 1.5}]
+            },
+            "Bob": {
+                "experience_gains": [{"skill": "attack", "gained": 200}],
+                "boss_gains": [{"boss": "zulrah", "gained": 2}, {"boss": "vorkath", "gained": 7}],
+                "activity_gains": [],
+                "efficiency_data": [{"ehp": 2.0, "ehb": 1.0, "gained": 3.0}]
+            },
+            "Carol": {
+                "experience_gains": [{"skill": "attack", "gained": 100}],
+                "boss_gains": [],
+                "activity_gains": [],
+                "efficiency_data": [{"ehp": 0.5, "ehb": 0.0, "gained": 0.5}]
+            }
+        }
+
+    def test_leaderboards_top_and_totals(self):
+        leaderboards = build_leaderboards(self.players, top_k=2)
+        self.assertEqual(leaderboards['experience_gains']['attack'], {'total': 400, 'top': [("Bob", 200), ("Alice", 100)]})
+        self.assertEqual(leaderboards['experience_gains']['magic'], {'total': 300, 'top': [("Alice", 300)]})
+        self.assertEqual(leaderboards['boss_gains']['zulrah'], {'total': 7, 'top': [("Alice", 5), ("Bob", 2)]})
+        self.assertEqual(leaderboards['boss_gains']['vorkath'], {'total': 7, 'top': [("Bob", 7)]})
+
+    def test_leaderboards_non_positive_top_k(self):
+        self.assertEqual(build_leaderboards(self.players, top_k=0), {'experience_gains': {}, 'boss_gains': {}})
+
+    def test_build_leaderboard_embeds(self):
+        embeds = build_leaderboard_embeds(build_leaderboards(self.players, top_k=1))
+        self.assertEqual([embed.title for embed in embeds], ["Day Top Gainers by Skill", "Day Top Gainers by Boss"])
+        self.assertEqual(embeds[0].fields[0]['name'], "Attack")
+        self.assertEqual(embeds[0].fields[0]['value'], "#1 Bob: `200` xp\nGroup: `400` xp")
+
+    def test_build_leaderboard_embeds_paginates_fields(self):
+        players = {"Alice": {"experience_gains": [{"skill": f"skill_{i}", "gained": i + 1} for i in range(30)], "boss_gains": []}}
+        embeds = build_leaderboard_embeds(build_leaderboards(players))
+        self.assertEqual([len(embed.fields) for embed in embeds], [25, 5])
+        self.assertEqual(embeds[1].title, "Day Top Gainers by Skill (2/2)")
+
+    def test_build_leaderboard_embeds_respects_character_limit(self):
+        skills = [f"skill_{i}" for i in range(23)]
+        players = {
+            f"LongPlayerName{p:02d}": {"experience_gains": [{"skill": skill, "gained": 1000000 + p} for skill in skills], "boss_gains": []}
+            for p in range(12)
+        }
+        embeds = build_leaderboard_embeds(build_leaderboards(players, top_k=MAX_LEADERBOARD_TOP_K))
+        self.assertGreater(len(embeds), 1)
+        self.assertEqual(sum(len(embed.fields) for embed in embeds), 23)
+        for embed in embeds:
+            length = len(embed.title) + len(embed.description) + len(embed.footer['text']) + len(embed.author['name'])
+            length += sum(len(field['name']) + len(field['value']) for field in embed.fields)
+            self.assertLessEqual(length, 6000)
+
+    @patch.dict(os.environ, {'RANKING_TOP_N': '40'})
+    def test_get_ranking_top_n_is_capped(self):
+        self.assertEqual(get_ranking_top_n(), 25)
+
+    @patch.dict(os.environ, {'LEADERBOARD_TOP_K': '50'})
+    def test_get_leaderboard_top_k_is_capped(self):
+        self.assertEqual(get_leaderboard_top_k(), MAX_LEADERBOARD_TOP_K)
+
+class TestExecuteDiscordWebhooks(unittest.TestCase):
+    @patch('lambda_function.DiscordWebhook')
+    def test_execute_discord_webhooks_continues_after_delivery_error(self, mock_webhook):
+        mock_webhook.return_value.execute.side_effect = [requests.exceptions.ConnectionError("down"), None]
+        execute_discord_webhooks(iter([DiscordEmbed(title="First"), DiscordEmbed(title="Second")]), 'http://mockwebhookurl.com/test')
+        self.assertEqual(mock_webhook.return_value.execute.call_count, 2)
+
 if __name__ == "__main__":
     unittest.main()
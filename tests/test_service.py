@@ -0,0 +1,199 @@
+import unittest
+import asyncio
+import json
+import os
+from unittest.mock import patch
+from service import (
+    build_snapshot, load_service_config, new_service_state, publish_snapshot, route_request, refresh_once, start_http_server
+)
+
+def make_player_data(overall_xp, bosses=None):
+    return {
+        'data': {
+            'skills': {
+                'overall': {'metric': 'overall', 'experience': {'gained': overall_xp}},
+                'attack': {'metric': 'attack', 'experience': {'gained': overall_xp}},
+            },
+            'bosses': bosses or {},
+            'activities': {},
+            'computed': {'ehp': {'value': {'gained': 1.0}}, 'ehb': {'value': {'gained': 0.5}}}
+        }
+    }
+
+def make_config(**overrides):
+    config = {
+        'usernames': ['PlayerOne', 'PlayerTwo'],
+        'webhook_url': 'http://mockwebhookurl.com/test',
+        'period': 'day',
+        'sort_by': 'experience_gains',
+        'send_player_update': False,
+        'send_discord_on_refresh': False,
+        'send_ranking_embed': True,
+        'send_leaderboard_embed': False,
+        'leaderboard_top_k': 3,
+        'ranking_top_n': 25,
+        'refresh_interval_seconds': 900,
+        'host': '127.0.0.1',
+        'port': 0
+    }
+    config.update(overrides)
+    return config
+
+class TestBuildSnapshot(unittest.TestCase):
+    def test_build_snapshot_rankings_and_leaderboards(self):
+        responses = [make_player_data(100), make_player_data(300, {'zulrah': {'metric': 'zulrah', 'kills': {'gained': 4}}})]
+        with patch('lambda_function.get_player_data', side_effect=responses):
+            snapshot = build_snapshot(make_config())
+
+        self.assertEqual(snapshot['player_count'], 2)
+        self.assertEqual([player['username'] for player in snapshot['rankings']], ['PlayerTwo', 'PlayerOne'])
+        self.assertEqual(snapshot['rankings'][0], {'rank': 1, 'username': 'PlayerTwo', 'value': 300, 'experience': 300, 'ehp': 1.0, 'ehb': 0.5})
+        self.assertEqual(snapshot['leaderboards']['boss_gains']['zulrah'], {'total': 4, 'top': [{'username': 'PlayerTwo', 'gained': 4}]})
+
+class TestRouteRequest(unittest.TestCase):
+    def setUp(self):
+        self.service_state = new_service_state()
+
+    def test_route_request_before_first_refresh(self):
+        status, body = route_request(self.service_state, 'GET', '/rankings')
+        self.assertEqual(status, 503)
+        status, body = route_request(self.service_state, 'GET', '/health')
+        self.assertEqual(status, 200)
+        self.assertIsNone(json.loads(body)['refreshed_at'])
+
+    def test_route_request_serves_cached_snapshot(self):
+        with patch('lambda_function.get_player_data', return_value=make_player_data(100)):
+            publish_snapshot(self.service_state, build_snapshot(make_config()))
+
+        status, body = route_request(self.service_state, 'GET', '/rankings/?limit=1')
+        self.assertEqual(status, 200)
+        self.assertEqual(len(json.loads(body)['rankings']), 2)
+        self.assertEqual(route_request(self.service_state, 'GET', '/leaderboards')[0], 200)
+        self.assertEqual(route_request(self.service_state, 'POST', '/rankings')[0], 405)
+        self.assertEqual(route_request(self.service_state, 'GET', '/unknown')[0], 404)
+
+class TestLoadServiceConfig(unittest.TestCase):
+    @patch.dict(os.environ, {'USERNAMES': 'PlayerOne'}, clear=True)
+    def test_load_service_config_matches_lambda_defaults(self):
+        config = load_service_config()
+        self.assertTrue(config['send_ranking_embed'])
+        self.assertFalse(config['send_leaderboard_embed'])
+        self.assertEqual(config['ranking_top_n'], 25)
+
+    @patch.dict(os.environ, {'USERNAMES': 'PlayerOne', 'RANKING_TOP_N': '40', 'LEADERBOARD_TOP_K': '50'}, clear=True)
+    def test_load_service_config_caps_embed_sizes(self):
+        config = load_service_config()
+        self.assertEqual(config['ranking_top_n'], 25)
+        self.assertEqual(config['leaderboard_top_k'], 10)
+
+class TestRefreshOnce(unittest.IsolatedAsyncioTestCase):
+    @patch('service.execute_discord_webhooks')
+    async def test_refresh_once_posts_to_discord_when_enabled(self, mock_execute_webhooks):
+        service_state = new_service_state()
+        with patch('lambda_function.get_player_data', return_value=make_player_data(100)):
+            await refresh_once(service_state, make_config(send_discord_on_refresh=True, send_leaderboard_embed=True))
+
+        self.assertIn('/rankings', service_state['responses'])
+        titles = [embed.title for embed in mock_execute_webhooks.call_args.args[0]]
+        self.assertEqual(titles, ["Day Group Ranking by Experience Gains", "Day Top Gainers by Skill"])
+
+    @patch('service.execute_discord_webhooks')
+    async def test_refresh_once_respects_embed_flags(self, mock_execute_webhooks):
+        service_state = new_service_state()
+        with patch('lambda_function.get_player_data', return_value=make_player_data(100)):
+            await refresh_once(service_state, make_config(send_discord_on_refresh=True))
+        titles = [embed.title for embed in mock_execute_webhooks.call_args.args[0]]
+        self.assertEqual(titles, ["Day Group Ranking by Experience Gains"])
+
+        mock_execute_webhooks.reset_mock()
+        with patch('lambda_function.get_player_data', return_value=make_player_data(100)):
+            await refresh_once(service_state, make_config(send_discord_on_refresh=True, send_ranking_embed=False))
+        mock_execute_webhooks.assert_not_called()
+
+    @patch('service.execute_discord_webhooks')
+    async def test_refresh_once_caps_discord_ranking_at_top_n(self, mock_execute_webhooks):
+        service_state = new_service_state()
+        usernames = [f"Player{i:02d}" for i in range(40)]
+        responses = [make_player_data(i + 1) for i in range(40)]
+        with patch('lambda_function.get_player_data', side_effect=responses):
+            await refresh_once(service_state, make_config(usernames=usernames, send_discord_on_refresh=True))
+
+        self.assertEqual(len(service_state['snapshot']['rankings']), 40)
+        ranking_embed = mock_execute_webhooks.call_args.args[0][0]
+        self.assertEqual(len(ranking_embed.fields), 25)
+        self.assertEqual(ranking_embed.fields[0]['name'], "#1 Player39")
+
+    async def test_refresh_once_keeps_previous_snapshot_when_fetches_fail(self):
+        service_state = new_service_state()
+        config = make_config()
+        with patch('lambda_function.get_player_data', return_value=make_player_data(100)):
+            await refresh_once(service_state, config)
+        good_rankings = service_state['responses']['/rankings']
+
+        with patch('lambda_function.get_player_data', return_value={'error': 'HTTP error occurred: 503', 'status_code': 503}):
+            await refresh_once(service_state, config)
+
+        self.assertEqual(service_state['responses']['/rankings'], good_rankings)
+        self.assertEqual(json.loads(service_state['responses']['/rankings'])['player_count'], 2)
+        self.assertIn("2 of 2 player fetches failed", service_state['last_error'])
+        self.assertEqual(json.loads(route_request(service_state, 'GET', '/health')[1])['status'], 'degraded')
+
+    async def test_refresh_once_publishes_when_few_fetches_fail(self):
+        service_state = new_service_state()
+        responses = [make_player_data(100), make_player_data(200), {'error': 'HTTP error occurred: 503', 'status_code': 503}]
+        with patch('lambda_function.get_player_data', side_effect=responses):
+            await refresh_once(service_state, make_config(usernames=['PlayerOne', 'PlayerTwo', 'PlayerThree']))
+
+        self.assertIsNone(service_state['last_error'])
+        self.assertEqual(service_state['snapshot']['failed_fetch_count'], 1)
+        self.assertEqual(service_state['snapshot']['player_count'], 2)
+
+    @patch('service.build_snapshot', side_effect=RuntimeError("boom"))
+    async def test_refresh_once_keeps_previous_snapshot_on_error(self, mock_build_snapshot):
+        service_state = new_service_state()
+        service_state['responses'] = {'/rankings': b'{}'}
+        await refresh_once(service_state, make_config())
+        self.assertEqual(service_state['responses'], {'/rankings': b'{}'})
+        self.assertEqual(service_state['last_error'], "boom")
+
+class TestHttpServer(unittest.IsolatedAsyncioTestCase):
+    async def test_http_server_serves_rankings(self):
+        service_state = new_service_state()
+        with patch('lambda_function.get_player_data', return_value=make_player_data(100)):
+            publish_snapshot(service_state, build_snapshot(make_config()))
+
+        server = await start_http_server(service_state, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"GET /rankings HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+
+        head, body = response.split(b"\r\n\r\n", 1)
+        self.assertTrue(head.startswith(b"HTTP/1.1 200 OK"))
+        self.assertEqual(json.loads(body)['player_count'], 2)
+
+    async def _request(self, service_state, payload):
+        server = await start_http_server(service_state, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(payload)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+        return response
+
+    async def test_http_server_rejects_oversized_request_line(self):
+        response = await self._request(new_service_state(), b"GET /" + b"a" * (70 * 1024) + b" HTTP/1.1\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 400 Bad Request"))
+
+    @patch('service.REQUEST_READ_TIMEOUT_SECONDS', 0.1)
+    async def test_http_server_times_out_idle_clients(self):
+        response = await self._request(new_service_state(), b"GET /health HTTP/1.1\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 408 Request Timeout"))
+
+if __name__ == "__main__":
+    unittest.main()